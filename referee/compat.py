@@ -0,0 +1,8 @@
+from django.db import transaction
+
+
+# Django 1.6 replaced commit_on_success with atomic. Note that unlike
+# atomic, commit_on_success does not use savepoints: leaving the block
+# commits the whole transaction of the connection, including any work
+# the caller has not committed yet.
+atomic = getattr(transaction, 'atomic', None) or transaction.commit_on_success
@@ -1,11 +1,16 @@
 from __future__ import unicode_literals
 
+from datetime import timedelta
+
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from .compat import atomic
 from .managers import CurrentTimePeriodManager, CurrentAndPastTimePeriodManager
+from .signals import time_periods_rolled_over
 
 
 class TimePeriodBase(models.Model):
@@ -71,6 +76,105 @@ class TimePeriodBase(models.Model):
 
         return cls.objects.filter(period_start__lt=current)
 
+    @classmethod
+    def rollover(cls, name, at=None, next_end=None):
+        '''Closes the open-ended period and starts a new one called `name`.
+
+        The open period ends one microsecond before `at` (defaults to now) and
+        the new period starts at `at`, running until `next_end` or
+        open-ended if that is None.
+
+        Returns:
+          The newly started period.
+
+        Raises:
+          DoesNotExist: If there is no open-ended period to close
+          MultipleObjectsReturned: If there is more than one open-ended
+            period, the timeline is broken and has to be fixed by hand
+          ValidationError: If the new period would overlap another period
+            or its name is already taken
+
+        '''
+        return rollover_time_periods([(cls, name, at, next_end)])[0]
+
+    @classmethod
+    def _rollover(cls, name, at=None, next_end=None):
+        '''Does the actual rollover, expects to be run in a transaction.'''
+        if at is None:
+            at = timezone.now()
+
+        current = cls.objects.select_for_update().get(period_end__isnull=True)
+        current_end = at - timedelta(microseconds=1)
+
+        if current_end <= current.period_start:
+            raise ValidationError(
+                _('period_end needs to be after period_start')
+            )
+        if next_end is not None and next_end <= at:
+            raise ValidationError(
+                _('period_end needs to be after period_start')
+            )
+
+        # The only neighbour check needed: nothing but the period being
+        # closed may touch the range of the new period, and no period at
+        # all may already have its name.
+        overlaps = Q(period_end__isnull=True) | Q(period_end__gte=at)
+        if next_end is not None:
+            overlaps &= Q(period_start__lte=next_end)
+        conflicts = list(cls.objects
+                         .filter(Q(name=name) | (~Q(pk=current.pk) & overlaps))
+                         .values_list('name', flat=True)[:1])
+
+        if conflicts and conflicts[0] == name:
+            raise ValidationError(
+                _('A period named {0} already exists.'.format(name))
+            )
+        if conflicts:
+            raise ValidationError(_('This period encompass another period.'))
+
+        cls.objects.filter(pk=current.pk).update(period_end=current_end)
+        current.period_end = current_end
+
+        return current, cls.objects.create(name=name, period_start=at,
+                                           period_end=next_end)
+
 
 class TimePeriod(TimePeriodBase):
     pass
+
+
+def rollover_time_periods(rollovers):
+    '''Rolls over several time periods in one transaction.
+
+    Takes an iterable of `(model, name[, at[, next_end]])` tuples where
+    `model` implements TimePeriodBase, see `TimePeriodBase.rollover`.
+    If any rollover fails none of them are applied.
+
+    `time_periods_rolled_over` is sent once per model when the
+    transaction block has been left. On Django 1.6 and above that is
+    only a commit if the caller is not in a transaction already,
+    otherwise the rollover could still be rolled back. On older versions
+    leaving the block commits the caller's transaction as well, so any
+    pending work of the caller gets committed with the rollover.
+
+    Returns:
+      A list of the newly started periods in the order given.
+
+    '''
+    opened = []
+    by_model = {}
+
+    with atomic():
+        for rollover in rollovers:
+            model, args = rollover[0], rollover[1:]
+            closed_period, new_period = model._rollover(*args)
+
+            opened.append(new_period)
+            changes = by_model.setdefault(model, ([], []))
+            changes[0].append(closed_period)
+            changes[1].append(new_period)
+
+    for model, (closed, new) in by_model.items():
+        time_periods_rolled_over.send(sender=model, closed=closed, opened=new)
+
+    return opened
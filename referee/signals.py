@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+
+# Sent once per model when the rollover's transaction block has been left.
+# `closed` and `opened` are lists of the periods that were ended and
+# started, in the order they were rolled over. Hook any caching of periods
+# onto this. See `referee.models.rollover_time_periods` for what has been
+# committed at that point.
+time_periods_rolled_over = Signal(providing_args=['closed', 'opened'])
@@ -1,24 +1,205 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import islice
 
 from django.utils import timezone
 import factory
 
+from referee.compat import atomic
 from test_app.models import TimePeriod
 
 
+TIMELINE_START = datetime(2013, 5, 6, tzinfo=timezone.utc)
+PERIOD_LENGTH = timedelta(days=7)
+
+
+class TimelineCursor(object):
+    '''Hands out consecutive spans of time and names not used yet.
+
+    Shared by `TimePeriodFactory` and `time_period_timeline` so periods
+    made by either never collide with each other. Nothing can come after
+    an open-ended span, so once one has been handed out every further
+    reservation raises ValueError until the cursor is reset.
+
+    '''
+    def __init__(self, start):
+        self.initial_start = start
+        self.reset()
+
+    def reset(self):
+        self.set_state((self.initial_start, 0, False))
+
+    def get_state(self):
+        return (self.start, self.names, self.open_ended)
+
+    def set_state(self, state):
+        self.start, self.names, self.open_ended = state
+
+    def reserve(self, span, open_ended=False):
+        if self.open_ended:
+            raise ValueError('The timeline ends with an open-ended period, '
+                             'reset it before adding more periods.')
+
+        start = self.start
+        self.start += span
+        self.open_ended = open_ended
+        return start
+
+    def reserve_names(self, count):
+        first = self.names
+        self.names += count
+        return first
+
+
+timeline_cursor = TimelineCursor(TIMELINE_START)
+
+
+class TimelineMixin(object):
+    '''Resets the shared timeline before every test.
+
+    Makes the dates and names of factory made and seeded periods the
+    same no matter which tests ran before.
+
+    '''
+    def setUp(self):
+        super(TimelineMixin, self).setUp()
+        timeline_cursor.reset()
+
+
 class TimePeriodFactory(factory.DjangoModelFactory):
     FACTORY_FOR = TimePeriod
 
-    name = factory.Sequence(lambda n: 'Period {0}'.format(n))
-    period_start = factory.Iterator((
-        datetime(2013, 5, 6, tzinfo=timezone.utc),
-        datetime(2013, 5, 13, tzinfo=timezone.utc),
-        datetime(2013, 5, 20, tzinfo=timezone.utc),
-        datetime(2013, 5, 27, tzinfo=timezone.utc),
-    ))
-    period_end = factory.Iterator((
-        datetime(2013, 5, 12, 23, 59, 59, tzinfo=timezone.utc),
-        datetime(2013, 5, 19, 23, 59, 59, tzinfo=timezone.utc),
-        datetime(2013, 5, 26, 23, 59, 59, tzinfo=timezone.utc),
-        datetime(2013, 6, 2, 23, 59, 59, tzinfo=timezone.utc),
-    ))
+    # Takes the next free name and week of the timeline shared with the
+    # seeder
+    name = factory.LazyAttribute(
+        lambda o: 'Period {0}'.format(timeline_cursor.reserve_names(1)))
+    period_start = factory.LazyAttribute(
+        lambda o: timeline_cursor.reserve(PERIOD_LENGTH))
+    period_end = factory.LazyAttribute(
+        lambda o: o.period_start + PERIOD_LENGTH - timedelta(seconds=1))
+
+
+def time_period_timeline(count, model=TimePeriod, start=None,
+                         length=PERIOD_LENGTH, gap=timedelta(0),
+                         open_ended=False, name='Seeded period {0}'):
+    '''Generates `count` unsaved, non-overlapping periods in order.
+
+    Every period is `length` long and ends one second before the next
+    one starts, with `gap` added between them. If `open_ended` is True
+    the last period has no end.
+
+    Unless `start` is given the timeline is placed after every period
+    made so far by this function or `TimePeriodFactory`, and if it is
+    open-ended no more periods can be made until `timeline_cursor` is
+    reset. Names are numbered over all timelines so they stay unique.
+
+    '''
+    if start is None:
+        start = timeline_cursor.reserve((length + gap) * count,
+                                        open_ended=open_ended)
+    first_name = timeline_cursor.reserve_names(count)
+
+    return _timeline(count, model, start, length, gap, open_ended,
+                     name, first_name)
+
+
+def _timeline(count, model, start, length, gap, open_ended, name,
+              first_name):
+    for n in range(count):
+        period_start = start + (length + gap) * n
+        if open_ended and n == count - 1:
+            period_end = None
+        else:
+            period_end = period_start + length - timedelta(seconds=1)
+
+        yield model(name=name.format(first_name + n),
+                    period_start=period_start,
+                    period_end=period_end)
+
+
+def seed_time_periods(count, model=TimePeriod, batch_size=500, **kwargs):
+    '''Saves a timeline of `count` periods with `bulk_create`.
+
+    Inserts `batch_size` periods at a time, takes the same keyword
+    arguments as `time_period_timeline`.
+
+    Returns:
+      The number of periods created.
+
+    '''
+    return load_time_periods(
+        time_period_timeline(count, model=model, **kwargs),
+        model=model, batch_size=batch_size)
+
+
+def load_time_periods(periods, model=TimePeriod, batch_size=500):
+    '''Saves unsaved `periods` with `bulk_create`, `batch_size` at a time.'''
+    periods = iter(periods)
+    created = 0
+
+    while True:
+        batch = list(islice(periods, batch_size))
+        if not batch:
+            return created
+
+        model.objects.bulk_create(batch)
+        created += len(batch)
+
+
+class TimePeriodSnapshotMixin(TimelineMixin):
+    '''Loads a large timeline of periods for all tests of a TestCase.
+
+    The timeline is generated once per test run, from a reset
+    `timeline_cursor`, so every test case with the same configuration
+    gets identical periods. The rows are bulk loaded in `setUpClass` of
+    every test case and removed in `tearDownClass`: on Django 1.5 rows
+    kept around for the whole run would be committed and show up in
+    test cases that don't expect them. Every test is rolled back to the
+    loaded timeline by `TestCase` and starts with `timeline_cursor`
+    right after it. If loading fails nothing is left in the database.
+
+    Configuration:
+      `snapshot_model`: The model class that implements TimePeriodBase.
+      `snapshot_size`: Number of periods in the timeline
+      `snapshot_options`: Keyword arguments for `time_period_timeline`
+
+    '''
+    snapshot_model = TimePeriod
+    snapshot_size = 1000
+    snapshot_options = {}
+
+    _snapshots = {}
+
+    @classmethod
+    def get_snapshot(cls):
+        '''Returns the periods and the timeline state right after them.'''
+        key = (cls.snapshot_model, cls.snapshot_size,
+               tuple(sorted(cls.snapshot_options.items())))
+        if key not in cls._snapshots:
+            timeline_cursor.reset()
+            periods = list(time_period_timeline(
+                cls.snapshot_size, model=cls.snapshot_model,
+                **cls.snapshot_options
+            ))
+            cls._snapshots[key] = (periods, timeline_cursor.get_state())
+
+        return cls._snapshots[key]
+
+    @classmethod
+    def setUpClass(cls):
+        super(TimePeriodSnapshotMixin, cls).setUpClass()
+        try:
+            periods, cls.timeline_state = cls.get_snapshot()
+            with atomic():
+                load_time_periods(periods, model=cls.snapshot_model)
+        except Exception:
+            super(TimePeriodSnapshotMixin, cls).tearDownClass()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.snapshot_model.objects.all().delete()
+        super(TimePeriodSnapshotMixin, cls).tearDownClass()
+
+    def setUp(self):
+        super(TimePeriodSnapshotMixin, self).setUp()
+        timeline_cursor.set_state(self.timeline_state)
@@ -2,16 +2,23 @@ import datetime
 
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
 
 from mock import Mock, patch
 
-from .factories import TimePeriodFactory
+from referee.models import TimePeriod as RefereeTimePeriod
+from referee.models import rollover_time_periods
+from referee.signals import time_periods_rolled_over
+
+from .factories import (
+    PERIOD_LENGTH, TIMELINE_START, TimelineMixin, TimePeriodFactory,
+    TimePeriodSnapshotMixin, seed_time_periods, time_period_timeline,
+)
 from test_app.models import TimePeriod
 
 
-class TimePeriodTest(TestCase):
+class TimePeriodTest(TimelineMixin, TestCase):
     def test_should_create_several_periods_without_a_problem(self):
         TimePeriodFactory.create()
         TimePeriodFactory.create()
@@ -116,3 +123,243 @@ class TimePeriodTest(TestCase):
                    Mock(return_value=period_1.period_end)):
             period = TimePeriod.current.get()
             self.assertEqual(period.pk, period_1.pk)
+
+
+class TimePeriodRolloverTest(TimelineMixin, TestCase):
+    def setUp(self):
+        super(TimePeriodRolloverTest, self).setUp()
+        self.open_period = TimePeriodFactory.create(period_end=None)
+        self.at = self.open_period.period_start + datetime.timedelta(days=7)
+
+    def test_rollover_closes_open_period_and_starts_next(self):
+        period = TimePeriod.rollover('Next', at=self.at)
+
+        closed = TimePeriod.objects.get(pk=self.open_period.pk)
+        self.assertEqual(closed.period_end,
+                         self.at - datetime.timedelta(microseconds=1))
+        self.assertEqual(period.name, 'Next')
+        self.assertEqual(period.period_start, self.at)
+        self.assertEqual(period.period_end, None)
+
+    def test_rollover_new_period_is_current(self):
+        period = TimePeriod.rollover('Next', at=self.at)
+
+        with patch('django.utils.timezone.now',
+                   Mock(return_value=self.at)):
+            self.assertEqual(TimePeriod.current.get().pk, period.pk)
+
+    def test_rollover_leaves_no_gap_before_next_period(self):
+        at = self.at + datetime.timedelta(microseconds=500000)
+        TimePeriod.rollover('Next', at=at)
+
+        just_before = at - datetime.timedelta(microseconds=1)
+        with patch('django.utils.timezone.now',
+                   Mock(return_value=just_before)):
+            self.assertEqual(TimePeriod.current.get().pk, self.open_period.pk)
+
+    def test_rollover_can_set_end_of_next_period(self):
+        next_end = self.at + datetime.timedelta(days=7)
+        period = TimePeriod.rollover('Next', at=self.at, next_end=next_end)
+
+        self.assertEqual(period.period_end, next_end)
+        self.assertFalse(TimePeriod.objects.filter(
+            period_end__isnull=True).exists())
+
+    def test_rollover_needs_an_open_period(self):
+        TimePeriod.rollover('Next', at=self.at,
+                            next_end=self.at + datetime.timedelta(days=7))
+
+        with self.assertRaises(TimePeriod.DoesNotExist):
+            TimePeriod.rollover('Another', at=self.at)
+
+    def test_rollover_can_not_end_before_open_period_start(self):
+        with self.assertRaises(ValidationError):
+            TimePeriod.rollover('Next', at=self.open_period.period_start)
+
+        self.assertEqual(TimePeriod.objects.count(), 1)
+
+    def test_rollover_name_needs_to_be_unique(self):
+        with self.assertRaises(ValidationError):
+            TimePeriod.rollover(self.open_period.name, at=self.at)
+
+        self.assertEqual(TimePeriod.objects.count(), 1)
+
+    def test_rollover_with_several_open_periods_should_fail(self):
+        TimePeriodFactory.create(
+            period_start=self.at + datetime.timedelta(days=7), period_end=None)
+
+        with self.assertRaises(TimePeriod.MultipleObjectsReturned):
+            TimePeriod.rollover('Next', at=self.at)
+
+    def test_rollover_should_send_one_signal(self):
+        receiver = Mock()
+        time_periods_rolled_over.connect(receiver, sender=TimePeriod)
+        try:
+            period = TimePeriod.rollover('Next', at=self.at)
+        finally:
+            time_periods_rolled_over.disconnect(receiver, sender=TimePeriod)
+
+        self.assertEqual(receiver.call_count, 1)
+        kwargs = receiver.call_args[1]
+        self.assertEqual([p.pk for p in kwargs['opened']], [period.pk])
+        self.assertEqual([p.pk for p in kwargs['closed']],
+                         [self.open_period.pk])
+
+    def test_rollover_several_periods_in_one_go(self):
+        second_at = self.at + datetime.timedelta(days=7)
+        receiver = Mock()
+        time_periods_rolled_over.connect(receiver, sender=TimePeriod)
+        try:
+            periods = rollover_time_periods([
+                (TimePeriod, 'Next', self.at),
+                (TimePeriod, 'After next', second_at),
+            ])
+        finally:
+            time_periods_rolled_over.disconnect(receiver, sender=TimePeriod)
+
+        self.assertEqual([p.name for p in periods], ['Next', 'After next'])
+        self.assertEqual(TimePeriod.objects.get(pk=periods[0].pk).period_end,
+                         second_at - datetime.timedelta(microseconds=1))
+        self.assertEqual(receiver.call_count, 1)
+
+
+
+class TimePeriodRolloverTransactionTest(TimelineMixin, TransactionTestCase):
+    def setUp(self):
+        super(TimePeriodRolloverTransactionTest, self).setUp()
+        self.open_period = TimePeriodFactory.create(period_end=None)
+        self.at = self.open_period.period_start + datetime.timedelta(days=7)
+        self.referee_period = RefereeTimePeriod.objects.create(
+            name='Referee period', period_start=self.open_period.period_start)
+
+        self.receiver = Mock()
+        time_periods_rolled_over.connect(self.receiver)
+
+    def tearDown(self):
+        time_periods_rolled_over.disconnect(self.receiver)
+
+    def test_failed_batch_should_apply_nothing(self):
+        with self.assertRaises(ValidationError):
+            rollover_time_periods([
+                (TimePeriod, 'Next', self.at),
+                (RefereeTimePeriod, 'Too early',
+                 self.referee_period.period_start),
+            ])
+
+        self.assertEqual(
+            TimePeriod.objects.get(pk=self.open_period.pk).period_end, None)
+        self.assertEqual(TimePeriod.objects.count(), 1)
+        self.assertEqual(RefereeTimePeriod.objects.count(), 1)
+        self.assertFalse(self.receiver.called)
+
+    def test_batch_should_send_one_signal_per_model(self):
+        rollover_time_periods([
+            (TimePeriod, 'Next', self.at),
+            (RefereeTimePeriod, 'Referee next', self.at),
+            (TimePeriod, 'After next',
+             self.at + datetime.timedelta(days=7)),
+        ])
+
+        senders = [c[1]['sender'] for c in self.receiver.call_args_list]
+        self.assertEqual(sorted(senders, key=id),
+                         sorted([TimePeriod, RefereeTimePeriod], key=id))
+        for call in self.receiver.call_args_list:
+            expected = 2 if call[1]['sender'] is TimePeriod else 1
+            self.assertEqual(len(call[1]['opened']), expected)
+            self.assertEqual(len(call[1]['closed']), expected)
+
+
+class TimePeriodTimelineTest(TimelineMixin, TestCase):
+    def test_timeline_periods_should_not_overlap(self):
+        periods = list(time_period_timeline(3, gap=datetime.timedelta(days=1)))
+
+        self.assertEqual(len(periods), 3)
+        for period in periods:
+            self.assertTrue(period.period_end > period.period_start)
+        for before, after in zip(periods, periods[1:]):
+            self.assertTrue(before.period_end < after.period_start)
+
+    def test_timeline_can_be_open_ended(self):
+        periods = list(time_period_timeline(3, open_ended=True))
+
+        self.assertEqual(periods[-1].period_end, None)
+        self.assertNotEqual(periods[-2].period_end, None)
+
+    def test_seed_time_periods_in_batches(self):
+        created = seed_time_periods(25, batch_size=10)
+
+        self.assertEqual(created, 25)
+        self.assertEqual(TimePeriod.objects.count(), 25)
+
+    def test_seeding_does_not_collide_with_factory(self):
+        for i in range(3):
+            TimePeriodFactory.create()
+        seed_time_periods(100)
+        seed_time_periods(100)
+        TimePeriodFactory.create()
+
+        self.assertEqual(TimePeriod.objects.count(), 204)
+
+    def test_nothing_can_come_after_open_ended_timeline(self):
+        seed_time_periods(5, open_ended=True)
+
+        with self.assertRaises(ValueError):
+            TimePeriodFactory.create()
+        with self.assertRaises(ValueError):
+            seed_time_periods(5)
+
+    def test_timeline_starts_over_for_every_test(self):
+        self.assertEqual(TimePeriodFactory.build().period_start,
+                         TIMELINE_START)
+        self.assertEqual(next(time_period_timeline(1)).name,
+                         'Seeded period 1')
+
+
+class TimePeriodSnapshotTest(TimePeriodSnapshotMixin, TestCase):
+    snapshot_size = 2000
+    snapshot_options = {'open_ended': True}
+
+    def test_snapshot_is_loaded(self):
+        self.assertEqual(TimePeriod.objects.count(), self.snapshot_size)
+
+    def test_find_current_active_period(self):
+        period = TimePeriod.objects.order_by('period_start')[1000]
+
+        with patch('django.utils.timezone.now',
+                   Mock(return_value=period.period_start)):
+            self.assertEqual(TimePeriod.current.get().pk, period.pk)
+            self.assertEqual(TimePeriod.past_periods().count(), 1000)
+            self.assertEqual(TimePeriod.current_and_past.count(), 1001)
+
+    # Both tests change the snapshot and first check that it is intact,
+    # whichever runs last shows it was restored after the other one.
+    def test_rollover_the_open_ended_tail(self):
+        self.assertEqual(TimePeriod.objects.count(), self.snapshot_size)
+        tail = TimePeriod.objects.get(period_end__isnull=True)
+        period = TimePeriod.rollover(
+            'Tail', at=tail.period_start + PERIOD_LENGTH)
+
+        self.assertEqual(TimePeriod.objects.count(), self.snapshot_size + 1)
+        self.assertEqual(
+            TimePeriod.objects.get(period_end__isnull=True).pk, period.pk)
+
+    def test_deleted_periods_are_restored(self):
+        self.assertEqual(TimePeriod.objects.count(), self.snapshot_size)
+        TimePeriod.objects.all().delete()
+
+    def test_factory_refuses_periods_after_open_ended_tail(self):
+        with self.assertRaises(ValueError):
+            TimePeriodFactory.create()
+
+
+class TimePeriodClosedSnapshotTest(TimePeriodSnapshotMixin, TestCase):
+    snapshot_size = 2000
+
+    def test_factory_periods_come_after_snapshot(self):
+        last = TimePeriod.objects.order_by('-period_start')[0]
+        period = TimePeriodFactory.create()
+
+        self.assertTrue(period.period_start > last.period_end)
+        with patch('django.utils.timezone.now',
+                   Mock(return_value=period.period_start)):
+            self.assertEqual(TimePeriod.current.get().pk, period.pk)
@@ -4,6 +4,9 @@ from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.utils import timezone
 
+from mock import Mock, patch
+
+from .factories import TimePeriodSnapshotMixin
 from test_app.models import TimePeriod
 
 
@@ -41,3 +44,32 @@ class TimePeriodMixin(TestCase):
         self.assertIn('time_period', res.context)
         self.assertTrue(res.context['time_period'])
         self.assertEqual(res.context['time_period'].pk, time_period.pk)
+
+
+class TimePeriodMixinSnapshotTest(TimePeriodSnapshotMixin, TestCase):
+    snapshot_size = 2000
+
+    def setUp(self):
+        super(TimePeriodMixinSnapshotTest, self).setUp()
+        self.url = reverse('test:time-period')
+        self.periods = TimePeriod.objects.order_by('period_start')
+
+    def test_when_active_time_period_should_return_it(self):
+        time_period = self.periods[1500]
+        now = time_period.period_start + datetime.timedelta(days=1)
+
+        with patch('django.utils.timezone.now', Mock(return_value=now)):
+            res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.context['time_period'].pk, time_period.pk)
+
+    def test_when_after_all_time_periods_should_return_false(self):
+        now = (self.periods.reverse()[0].period_end
+               + datetime.timedelta(days=1))
+
+        with patch('django.utils.timezone.now', Mock(return_value=now)):
+            res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(res.context['time_period'])